@@ -1,8 +1,11 @@
 import argparse
 import asyncio
+import cProfile
 import gc
+import os
 import shutil
 import time
+from collections import deque
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
@@ -14,9 +17,22 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from obret.api.router import router
 from obret.config.config_loader import load_base_config
-from obret.index.mecab import build_index_from_notes
+from obret.index.mecab import analysis_settings, build_index_from_notes
+from obret.index.snapshot import import_snapshot, stale_notes
+from obret.index.worker import IndexBuildProcess
 from obret.retrieve.bm25 import build_pipeline
-from obret.utils.pyterrier_utils import create_japanese_analyzer, index_ready
+from obret.retrieve.warmup import select_warmup_queries, warm_up
+from obret.utils.crawler import VaultCrawler
+from obret.utils.profiling import PhaseTracker, Profiler, dump_profile
+from obret.utils.pyterrier_utils import (
+    create_japanese_analyzer,
+    index_ready,
+    materialize_index,
+    open_index,
+)
+
+# 一時ディレクトリで開いた索引を改名後もそのまま使えるか（Windows は開いたままのディレクトリを改名できない）
+KEEP_INDEX_OPEN_ACROSS_RENAME = os.name != "nt"
 
 
 @asynccontextmanager
@@ -29,15 +45,24 @@ async def lifespan(app: FastAPI, config_path: Optional[str]):
 
     # 検索パイププラインの初期化
     index_path = str(Path(cfg.index_dirpath).resolve())
+    crawler = VaultCrawler(cfg.vault_dirpath, cfg.exclude_dirnames)
+    restored = None
+    if not index_ready(index_path) and cfg.snapshot_filepath and Path(cfg.snapshot_filepath).is_file():
+        # スナップショットがあれば索引を作らずに展開し、すぐに検索を受け付ける
+        try:
+            restored = import_snapshot(cfg.snapshot_filepath, index_path)
+            print(f"Restored index from snapshot {cfg.snapshot_filepath} (created {restored['created']})")
+        except Exception as e:
+            print(f"Failed to restore snapshot {cfg.snapshot_filepath}: {e}")
     if not index_ready(index_path):
-        build_index_from_notes(cfg)
+        build_index(cfg, note_files=crawler.crawl())
 
     try:
-        index = pt.IndexFactory.of(index_path)
+        index = open_index(index_path, cfg.index_residency)
     except Exception:
         # Rebuild once in case an empty/corrupted index directory exists
-        build_index_from_notes(cfg)
-        index = pt.IndexFactory.of(index_path)
+        build_index(cfg, note_files=crawler.crawl())
+        index = open_index(index_path, cfg.index_residency)
     analyzer = create_japanese_analyzer(cfg.stopwords_filepath)
     pipeline = build_pipeline(index, analyzer)
 
@@ -52,18 +77,53 @@ async def lifespan(app: FastAPI, config_path: Optional[str]):
     app.state.reindexing = False
     app.state.reindex_progress = None
     app.state.swap_in_progress = False
+    app.state.build_process = None
+    app.state.crawler = crawler
+    app.state.recent_queries = deque(maxlen=cfg.recent_queries_size)
+    # 無効時は None のままにして検索・再インデックスの経路に計測処理を入れない
+    app.state.profiler = Profiler() if cfg.profiling_enabled else None
+    app.state.warmup = None
 
     # 自動再インデックスのためのタスク開始
     app.state.reindex_task = asyncio.create_task(periodic_reindex(app))
+    # スナップショットから復元した場合は、作成後に変わったノートだけをバックグラウンドで取り込む
+    app.state.restore_task = asyncio.create_task(catch_up_restored(app, restored)) if restored else None
 
     yield
 
     # アプリ終了時にタスクをキャンセル
-    app.state.reindex_task.cancel()
-    try:
-        await app.state.reindex_task
-    except asyncio.CancelledError:
-        pass
+    for task in (app.state.reindex_task, app.state.restore_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # 手動再インデックスのワーカーが残っていれば停止する
+    build_process = app.state.build_process
+    if build_process is not None:
+        build_process.cancel()
+
+
+def build_index(cfg, target_dirpath=None, progress_callback=None, note_files=None):
+    """設定に応じてワーカープロセスまたは自プロセスでインデックスを構築する"""
+    if cfg.isolated_indexing:
+        IndexBuildProcess(cfg, target_dirpath, progress_callback, note_files).run()
+    else:
+        build_index_from_notes(
+            cfg, target_dirpath=target_dirpath, progress_callback=progress_callback, note_files=note_files
+        )
+
+
+def _close_index(index):
+    close = getattr(index, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
 
 
 async def periodic_reindex(app: FastAPI):
@@ -78,6 +138,35 @@ async def periodic_reindex(app: FastAPI):
             print(f"Error during auto-reindexing: {e}")
 
 
+async def catch_up_restored(app: FastAPI, manifest: dict):
+    """
+    スナップショット作成後に追加・変更・削除されたノートがあれば再インデックスする。
+    変わっていないノートはスナップショットに含まれる解析結果を再利用するため、解析し直すのは差分のみ。
+    スナップショットの解析設定（パッセージ設定・ストップワード）が手元の設定と異なる場合は、全ノートを解析し直す。
+    """
+    try:
+        if manifest.get("analysis_settings") is None:
+            print("Restored index: snapshot has no note hashes (exported without analysis_cache), reindexing all notes")
+            await rebuild_index(app, reason="restore")
+            return
+        if manifest.get("analysis_settings") != analysis_settings(app.state.config):
+            print("Restored index: analysis settings differ from the snapshot, reindexing all notes")
+            await rebuild_index(app, reason="restore")
+            return
+        crawler = app.state.crawler
+        note_files = await asyncio.to_thread(crawler.crawl)
+        stale = await asyncio.to_thread(stale_notes, manifest, note_files, crawler.root)
+        if not stale:
+            print("Restored index is up to date with the vault")
+            return
+        print(f"Restored index: {len(stale)} notes changed since the snapshot, reindexing")
+        await rebuild_index(app, reason="restore")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error while catching up restored index: {e}")
+
+
 async def rebuild_index(app: FastAPI, reason: str = "manual"):
     async with app.state.reindex_lock:
         app.state.reindexing = True
@@ -87,7 +176,24 @@ async def rebuild_index(app: FastAPI, reason: str = "manual"):
         temp_dir = base_dir.with_name(base_dir.name + ".tmp")
         backup_dir = base_dir.with_name(base_dir.name + ".old")
 
-        def _build_and_swap():
+        # /debug/profile で次の再インデックスの計測が指定されていれば、各フェーズでメモリを記録する
+        profiler = app.state.profiler
+        profiling = profiler is not None and profiler.take_reindex()
+        tracker = PhaseTracker("server") if profiling else None
+        profile_stats = None
+        worker_memory = []
+
+        def _phase(name: str):
+            if tracker:
+                tracker.phase(name)
+
+        def _progress(done: int, total: int):
+            if total <= 0:
+                app.state.reindex_progress = 100.0
+            else:
+                app.state.reindex_progress = min(100.0, (done / total) * 100.0)
+
+        def _prepare():
             print(f"{reason.capitalize()} reindex: preparing temp index at {temp_dir}")
             temp_dir.parent.mkdir(parents=True, exist_ok=True)
             if temp_dir.exists():
@@ -95,25 +201,29 @@ async def rebuild_index(app: FastAPI, reason: str = "manual"):
             if backup_dir.exists():
                 shutil.rmtree(backup_dir)
 
-            def _progress(done: int, total: int):
-                if total <= 0:
-                    app.state.reindex_progress = 100.0
-                else:
-                    app.state.reindex_progress = min(100.0, (done / total) * 100.0)
-
-            build_index_from_notes(cfg, target_dirpath=temp_dir, progress_callback=_progress)
-
+        def _validate_and_swap(warmup_queries: list[str]):
             # Validate the freshly built index before swapping
-            temp_index = pt.IndexFactory.of(str(temp_dir))
+            # preload/memory の読み込みで検索を止めないよう、旧索引で検索を受けている間に本番と同じ常駐方法で開く
+            temp_index = open_index(temp_dir, cfg.index_residency)
             try:
                 _ = temp_index.getCollectionStatistics()
-            finally:
-                close_tmp = getattr(temp_index, "close", None)
-                if callable(close_tmp):
-                    try:
-                        close_tmp()
-                    except Exception:
-                        pass
+                if KEEP_INDEX_OPEN_ACROSS_RENAME:
+                    materialize_index(temp_index)
+                new_pipeline = build_pipeline(temp_index, app.state.analyzer)
+                if warmup_queries:
+                    # 差し替え後に配信するパイプラインそのものに直近のクエリを流し、索引の構造・Retriever・
+                    # ページキャッシュ・JIT を温める（Windows では開き直すため、引き継がれるのはページキャッシュと JIT のみ）
+                    seconds = warm_up(new_pipeline, warmup_queries)
+                    app.state.warmup = {"queries": len(warmup_queries), "seconds": seconds}
+                    print(
+                        f"{reason.capitalize()} reindex: warmed up with {len(warmup_queries)} queries in {seconds:.2f}s"
+                    )
+            except Exception:
+                _close_index(temp_index)
+                raise
+            if not KEEP_INDEX_OPEN_ACROSS_RENAME:
+                _close_index(temp_index)
+            _phase("validate")
 
             try:
                 # Block search only during the short swap window
@@ -149,6 +259,8 @@ async def rebuild_index(app: FastAPI, reason: str = "manual"):
                     raise rename_error
             except Exception as e:
                 print(f"Error swapping index dirs: {e}")
+                if KEEP_INDEX_OPEN_ACROSS_RENAME:
+                    _close_index(temp_index)
                 # Attempt to restore original layout and clean temp on failure
                 if not base_dir.exists() and backup_dir.exists():
                     backup_dir.rename(base_dir)
@@ -158,20 +270,71 @@ async def rebuild_index(app: FastAPI, reason: str = "manual"):
             finally:
                 app.state.swap_in_progress = False
 
-            index = pt.IndexFactory.of(str(base_dir))
-            pipeline = build_pipeline(index, app.state.analyzer)
+            if KEEP_INDEX_OPEN_ACROSS_RENAME:
+                # 構造は改名前に開いてあるので、読み込み直さずにそのまま使う
+                index, pipeline = temp_index, new_pipeline
+            else:
+                index = open_index(base_dir, cfg.index_residency)
+                pipeline = build_pipeline(index, app.state.analyzer)
+            _phase("swap")
             print(
                 f"{reason.capitalize()} reindex: swap completed (old backup={backup_dir})"
             )
             return index, pipeline
 
         try:
-            index, pipeline = await asyncio.to_thread(_build_and_swap)
+            await asyncio.to_thread(_prepare)
+            # vault の走査はディレクトリ一覧のキャッシュを持つサーバー側で行う
+            crawler = app.state.crawler
+            crawler.set_exclude_dirnames(cfg.exclude_dirnames)
+            note_files = await asyncio.to_thread(crawler.crawl)
+            _phase("scan")
+            if cfg.isolated_indexing:
+                # 解析・索引付けは別プロセスで行い、完成したパスだけを受け取る
+                build_process = IndexBuildProcess(
+                    cfg, temp_dir, _progress, note_files, profile=profiling
+                ).start()
+                app.state.build_process = build_process
+                try:
+                    await asyncio.to_thread(build_process.wait)
+                except asyncio.CancelledError:
+                    build_process.cancel()
+                    raise
+                finally:
+                    app.state.build_process = None
+                if build_process.profile:
+                    profile_stats, worker_memory = build_process.profile
+            else:
+
+                def _build_in_thread():
+                    build_profile = cProfile.Profile() if profiling else None
+                    if build_profile:
+                        build_profile.enable()
+                    try:
+                        build_index_from_notes(
+                            cfg,
+                            target_dirpath=temp_dir,
+                            progress_callback=_progress,
+                            note_files=note_files,
+                            phase_callback=_phase if profiling else None,
+                        )
+                    finally:
+                        if build_profile:
+                            build_profile.disable()
+                    return dump_profile(build_profile) if build_profile else None
+
+                profile_stats = await asyncio.to_thread(_build_in_thread)
+            warmup_queries = select_warmup_queries(app.state.recent_queries, cfg.warmup_queries)
+            index, pipeline = await asyncio.to_thread(_validate_and_swap, warmup_queries)
             app.state.index = index
             app.state.pipeline = pipeline
         finally:
             app.state.reindexing = False
             app.state.reindex_progress = None
+            if tracker:
+                # scan の後にワーカー側のフェーズ（parse/analyze, terrier index）を並べる
+                server_memory = tracker.stop()
+                profiler.finish_reindex(profile_stats, server_memory[:1] + worker_memory + server_memory[1:])
 
 
 def create_app(config_path: Optional[str] = None):
@@ -1,11 +1,14 @@
 import asyncio
 import datetime
 from pathlib import Path
+from typing import Literal
 
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
 from pydantic import BaseModel, Field
 
-from obret.utils.pyterrier_utils import df_to_dict_list
+from obret.utils.profiling import format_profile
+from obret.utils.pyterrier_utils import df_to_dict_list, is_passage_index, read_index_stats
 
 router = APIRouter()
 
@@ -16,19 +19,35 @@ class ConfigUpdate(BaseModel):
     snippet_max_len: int | None = Field(None, gt=0, description="chars of context each side")
 
 
+class ProfileRequest(BaseModel):
+    target: Literal["search", "reindex"]
+    count: int = Field(10, gt=0, description="number of searches to profile (search only)")
+
+
 @router.get("/search")
 def search(request: Request, q: str = Query(..., description="Search query")):
     # Block only during the brief swap window to keep queries available while building
-    if getattr(request.app.state, "swap_in_progress", False):
+    pipeline = request.app.state.pipeline
+    if getattr(request.app.state, "swap_in_progress", False) or pipeline is None:
         raise HTTPException(status_code=503, detail="Reindexing in progress")
-    result_df = request.app.state.pipeline.search(q)
-    result = df_to_dict_list(
+    profiler = request.app.state.profiler
+    if profiler is not None:
+        result = profiler.profile_search(_search, request, pipeline, q)
+    else:
+        result = _search(request, pipeline, q)
+    # 再インデックス後のウォームアップで再生するために記録する
+    request.app.state.recent_queries.append(q)
+    return {"results": result}
+
+
+def _search(request: Request, pipeline, q: str):
+    result_df = pipeline.search(q)
+    return df_to_dict_list(
         result_df,
         snippet_maxlen=request.app.state.config.snippet_max_len,
         vault_dirpath=request.app.state.config.vault_dirpath,
         query=q,
     )
-    return {"results": result}
 
 
 @router.post("/index")
@@ -81,21 +100,71 @@ def index_status(request: Request):
         last_indexed = None
 
     note_count = None
+    passage_count = None
     idx = getattr(request.app.state, "index", None)
     if idx:
         try:
-            note_count = idx.getCollectionStatistics().getNumberOfDocuments()
+            document_count = idx.getCollectionStatistics().getNumberOfDocuments()
+            if is_passage_index(idx):
+                # パッセージ索引の文書数はパッセージ数なので、ノート数は構築時の記録から取る
+                passage_count = document_count
+                note_count = read_index_stats(index_path).get("note_count")
+            else:
+                note_count = document_count
         except Exception:
             note_count = None
 
+    warmup = getattr(request.app.state, "warmup", None) or {}
+
     return {
         "last_indexed": last_indexed,
         "note_count": note_count,
+        "passage_count": passage_count,
         "reindexing": bool(getattr(request.app.state, "reindexing", False)),
         "reindex_progress": getattr(request.app.state, "reindex_progress", None),
+        "warmup_queries": warmup.get("queries"),
+        "warmup_seconds": warmup.get("seconds"),
     }
 
 
+def _get_profiler(request: Request):
+    profiler = getattr(request.app.state, "profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set profiling_enabled)")
+    return profiler
+
+
+@router.post("/debug/profile")
+def start_profile(request: Request, payload: ProfileRequest):
+    # 次の N 回の検索、または次の再インデックスを計測する
+    profiler = _get_profiler(request)
+    profiler.arm(payload.target, payload.count)
+    return profiler.status()
+
+
+@router.get("/debug/profile")
+def profile_status(request: Request):
+    return _get_profiler(request).status()
+
+
+@router.get("/debug/profile/stats")
+def profile_stats(
+    request: Request,
+    format: Literal["prof", "text"] = Query("prof", description="prof = pstats binary, text = summary"),
+    limit: int = Query(40, gt=0),
+):
+    profiler = _get_profiler(request)
+    if profiler.stats is None:
+        raise HTTPException(status_code=404, detail="No profile captured yet")
+    if format == "text":
+        return PlainTextResponse(format_profile(profiler.stats, limit=limit))
+    return Response(
+        content=profiler.stats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="obret.prof"'},
+    )
+
+
 def schedule_rebuild(app):
     """明示的なインデックス再構築のバックグラウンドタスク"""
     try:
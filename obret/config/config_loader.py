@@ -36,5 +36,7 @@ def load_base_config(config_filepath: str | Path = "obret/config/base_config.yam
             config_dict["snippet_max_len"] = int(env_val)
         except ValueError:
             pass
+    if env_val := os.getenv("OBRET_INDEX_RESIDENCY"):
+        config_dict["index_residency"] = env_val
 
     return BaseConfig(**config_dict)
@@ -1,5 +1,7 @@
 from pathlib import Path
+from typing import Literal
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
@@ -11,5 +13,15 @@ class BaseConfig(BaseSettings):
     reindex_interval: int = 600  # seconds
     snippet_max_len: int = 100  # snippet context (chars) on each side
     indexing_threads: int | None = None  # None = auto (cpu count)
+    isolated_indexing: bool = True  # build indexes in a separate worker process
+    passage_mode: Literal["heading", "window"] | None = None  # None = one document per note
+    passage_length: int = Field(800, gt=0)  # max chars per passage
+    passage_stride: int = Field(600, gt=0)  # window step (chars); length - stride chars overlap
+    index_residency: Literal["disk", "preload", "memory"] = "disk"  # how index structures are loaded
+    warmup_queries: int = 20  # recent queries replayed on a new index before swap (0 = off)
+    recent_queries_size: int = 200  # ring buffer of recent searches used for warm-up
+    profiling_enabled: bool = False  # expose /debug/profile (cProfile + tracemalloc)
+    analysis_cache: bool = False  # keep per-note analysis next to the index and reuse it for unchanged notes
+    snapshot_filepath: str | None = None  # restore from this snapshot when no index exists
     api_host: str = "127.0.0.1"
     api_port: int = 8000
@@ -1,4 +1,9 @@
+import gzip
+import hashlib
+import json
 import os
+import re
+from bisect import bisect_left
 from pathlib import Path
 from typing import Callable, Generator, Iterable
 
@@ -6,74 +11,275 @@ import pyterrier as pt
 
 from obret.config.config_loader import load_base_config
 from obret.config.schema import BaseConfig
+from obret.utils.crawler import NoteFile, VaultCrawler
 from obret.utils.note import ObsidianNote
-from obret.utils.pyterrier_utils import create_japanese_analyzer, create_md_parser
+from obret.utils.pyterrier_utils import create_japanese_analyzer, create_md_parser, write_index_stats
+
+HEADING_REGEX = re.compile(r"^#{1,6}[ \t]", re.MULTILINE)
+FENCE_REGEX = re.compile(r"^(?:```|~~~)", re.MULTILINE)
+
+ANALYSIS_CACHE_FILENAME = "obret_analysis.jsonl.gz"
+ANALYSIS_CACHE_VERSION = 1
+
+NOTE_META = {"docno": 8, "linkpath": 128, "title_0": 128, "body_0": 1024}
+PASSAGE_META = {"docno": 16, "linkpath": 128, "title_0": 128, "body_0": 1024, "pstart": 10, "pend": 10}
+
+
+def split_windows(text: str, start: int, end: int, length: int, stride: int) -> list[tuple[int, int]]:
+    """text[start:end] を length 文字以内の窓に分割する（可能なら改行位置で切る）"""
+    overlap = max(0, length - stride)
+    spans = []
+    while start < end:
+        stop = min(end, start + length)
+        if stop < end:
+            newline = text.rfind("\n", start + stride // 2, stop)
+            if newline > start:
+                stop = newline + 1
+        spans.append((start, stop))
+        if stop >= end:
+            break
+        start = max(start + 1, stop - overlap)
+        # 重なり部分も行頭から始める
+        newline = text.find("\n", start, stop - 1)
+        if newline != -1:
+            start = newline + 1
+    return spans
+
+
+def split_passages(text: str, mode: str, length: int, stride: int) -> list[tuple[int, int]]:
+    """
+    本文をパッセージに分割し、各パッセージの (開始, 終了) 文字オフセットを返す。
+    heading: 見出しごとに区切り、length を超える節はさらに窓で分割する
+    window: length 文字の窓を stride 文字ずつずらして分割する
+    空白だけのパッセージは除き、本文が空でも 1 件は返す。
+    """
+    if mode == "heading":
+        # コードブロック内の "#" は見出しとして扱わない
+        fences = [m.start() for m in FENCE_REGEX.finditer(text)]
+        boundaries = [0]
+        for m in HEADING_REGEX.finditer(text):
+            if m.start() > 0 and bisect_left(fences, m.start()) % 2 == 0:
+                boundaries.append(m.start())
+        boundaries.append(len(text))
+        spans = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            spans.extend(split_windows(text, start, end, length, stride))
+    elif mode == "window":
+        spans = split_windows(text, 0, len(text), length, stride)
+    else:
+        raise ValueError(f"Unknown passage mode: {mode}")
+
+    spans = [(start, end) for start, end in spans if text[start:end].strip()]
+    return spans or [(0, len(text))]
+
+
+def analyze_note(
+    note: ObsidianNote,
+    analyzer: Callable,
+    md_parser: Callable,
+    passage_mode: str | None = None,
+    passage_length: int = 800,
+    passage_stride: int = 600,
+) -> list[dict]:
+    """ノートを解析し、docno と linkpath を除いた文書（パッセージ単位の場合は複数）を返す"""
+    frontmatter_values = (
+        " ".join(map(str, note.frontmatter.values())) if note.frontmatter else ""
+    )
+    title = analyzer(note.title)
+    title_0 = note.title
+    if passage_mode is None:
+        return [
+            {
+                "title": title,
+                "body": analyzer(note.body + " " + frontmatter_values),
+                "title_0": title_0,
+                "body_0": md_parser(note.body),
+            }
+        ]
+
+    docs = []
+    spans = split_passages(note.body, passage_mode, passage_length, passage_stride)
+    for j, (start, end) in enumerate(spans):
+        passage = note.body[start:end]
+        # frontmatter の値は先頭パッセージにだけ含める
+        analyzed = passage + " " + frontmatter_values if j == 0 else passage
+        docs.append(
+            {
+                "title": title,
+                "body": analyzer(analyzed),
+                "title_0": title_0,
+                "body_0": md_parser(passage),
+                "pstart": str(start),
+                "pend": str(end),
+            }
+        )
+    return docs
 
 
 def generate_notes(
-    filepaths: Iterable[Path],
+    note_files: Iterable[NoteFile],
     vault_dirpath: str | Path,
     analyzer: Callable,
     md_parser: Callable,
     progress_callback: Callable[[int, int], None] | None = None,
+    passage_mode: str | None = None,
+    passage_length: int = 800,
+    passage_stride: int = 600,
+    analysis_cache: dict[str, tuple[str, list[dict]]] | None = None,
+    analysis_writer: "AnalysisCacheWriter | None" = None,
 ) -> Generator:
-    vault_dirpath = Path(vault_dirpath)
+    """
+    ノートごとに 1 文書を生成する。passage_mode を指定した場合はパッセージごとに
+    "{ノート番号}%p{パッセージ番号}" の docno で文書を生成する（pt.text.max_passage の形式）。
+    pstart/pend は frontmatter を除いた本文上の文字オフセット。
+
+    analysis_cache に内容のハッシュが一致するノートがあれば解析を省いて再利用する（使った項目は取り除く）。
+    analysis_writer を渡すと、各ノートのハッシュと解析結果を逐次書き出す。
+    """
+    vault_dirpath = Path(vault_dirpath).resolve()
+    use_hash = analysis_cache is not None or analysis_writer is not None
     total = None
     try:
-        total = len(filepaths)  # type: ignore[arg-type]
+        total = len(note_files)  # type: ignore[arg-type]
     except Exception:
         pass
 
-    for i, note_filepath in enumerate(filepaths):
+    for i, note_file in enumerate(note_files):
         if i % 500 == 0 and i > 0:
-            print(f"  processed {i} notes... latest={note_filepath}")
+            print(f"  processed {i} notes... latest={note_file.path}")
 
-        note = ObsidianNote(vault_dirpath, note_filepath)
-        frontmatter_values = (
-            " ".join(map(str, note.frontmatter.values())) if note.frontmatter else ""
-        )
-        docno = str(i)
-        title = analyzer(note.title)
-        body = analyzer(note.body + " " + frontmatter_values)
-        linkpath = str(note.relative_path)
-        title_0 = note.title
-        body_0 = md_parser(note.body)
-        yield {
-            "docno": docno,
-            "title": title,
-            "body": body,
-            "linkpath": linkpath,
-            "title_0": title_0,
-            "body_0": body_0,
-        }
+        relative_path = note_file.path.relative_to(vault_dirpath)
+        key = relative_path.as_posix()
+        docs = None
+        content = None
+        content_hash = None
+        if use_hash:
+            data = note_file.path.read_bytes()
+            content_hash = hashlib.sha256(data).hexdigest()
+            # 構築中に前回の解析結果を抱え続けないよう、参照したものから手放す
+            cached = analysis_cache.pop(key, None) if analysis_cache else None
+            if cached and cached[0] == content_hash:
+                docs = cached[1]
+            else:
+                content = data.decode("utf-8")
+
+        reused = docs is not None
+        if not reused:
+            note = ObsidianNote(vault_dirpath, note_file.path, stat=note_file.stat, content=content)
+            docs = analyze_note(note, analyzer, md_parser, passage_mode, passage_length, passage_stride)
+        if analysis_writer is not None:
+            analysis_writer.write(key, content_hash, docs, reused)
+
+        linkpath = str(relative_path)
+        for j, doc in enumerate(docs):
+            yield {
+                "docno": str(i) if passage_mode is None else f"{i}%p{j}",
+                "linkpath": linkpath,
+                **doc,
+            }
         if progress_callback and total:
             progress_callback(i + 1, total)
 
 
+def _with_phase(docs: Iterable[dict], phase_callback: Callable[[str], None], name: str) -> Generator:
+    yield from docs
+    phase_callback(name)
+
+
+def analysis_settings(cfg: BaseConfig) -> dict:
+    """解析結果の再利用可否を決める設定（変わった場合はキャッシュを使わない）"""
+    return {
+        "version": ANALYSIS_CACHE_VERSION,
+        "passage_mode": cfg.passage_mode,
+        "passage_length": cfg.passage_length,
+        "passage_stride": cfg.passage_stride,
+        "stopwords": hashlib.sha256(Path(cfg.stopwords_filepath).read_bytes()).hexdigest(),
+    }
+
+
+def load_analysis_cache(index_dirpath: str | Path, settings: dict) -> dict[str, tuple[str, list[dict]]]:
+    """索引に添えて保存した解析結果を読む（無い・壊れている・設定が違う場合は空）"""
+    cache_filepath = Path(index_dirpath) / ANALYSIS_CACHE_FILENAME
+    if not cache_filepath.is_file():
+        return {}
+    try:
+        with gzip.open(cache_filepath, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("settings") != settings:
+                return {}
+            cache = {}
+            for line in f:
+                record = json.loads(line)
+                cache[record["linkpath"]] = (record["hash"], record["docs"])
+            return cache
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring analysis cache {cache_filepath}: {e}")
+        return {}
+
+
+class AnalysisCacheWriter:
+    """
+    解析結果をノートごとに一時ファイルへ書き出し、commit() で索引に添えるファイルとして確定する。
+    構築中に全ノートの解析結果をメモリに溜めないため、索引付けと並行して逐次書き出す。
+    """
+
+    def __init__(self, index_dirpath: str | Path, settings: dict):
+        self.filepath = Path(index_dirpath) / ANALYSIS_CACHE_FILENAME
+        self._tmp_filepath = self.filepath.with_name(self.filepath.name + ".tmp")
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self._tmp_filepath, "wt", encoding="utf-8", compresslevel=6)
+        self._file.write(json.dumps({"settings": settings}) + "\n")
+        self.analyzed = 0
+        self.reused = 0
+
+    def write(self, linkpath: str, content_hash: str, docs: list[dict], reused: bool = False):
+        record = {"linkpath": linkpath, "hash": content_hash, "docs": docs}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if reused:
+            self.reused += 1
+        else:
+            self.analyzed += 1
+
+    def commit(self):
+        self._file.close()
+        self._tmp_filepath.replace(self.filepath)
+
+    def discard(self):
+        self._file.close()
+        self._tmp_filepath.unlink(missing_ok=True)
+
+
 def build_index_from_notes(
     cfg: BaseConfig,
     target_dirpath: str | Path | None = None,
     progress_callback: Callable[[int, int], None] | None = None,
+    note_files: list[NoteFile] | None = None,
+    phase_callback: Callable[[str], None] | None = None,
 ):
+    """
+    ノートを解析して Terrier の索引を作る。
+    note_files を渡した場合は走査済みの一覧として使い、vault を再走査しない。
+    phase_callback はノートの解析が終わった時点（"parse/analyze"）と索引の書き出しが
+    終わった時点（"terrier index"）で呼ばれる（プロファイリング用）。
+
+    analysis_cache が有効な場合は、現在の索引（cfg.index_dirpath）に添えられた解析結果を読み込み、
+    内容が変わっていないノートは MeCab/mistune の解析を省く。構築後は新しい索引に解析結果を書き出す。
+    """
     index_dir = Path(target_dirpath) if target_dirpath else Path(cfg.index_dirpath)
     vault_dirpath = Path(cfg.vault_dirpath)
 
     # 対象ファイルの事前収集で総数を把握
-    filepaths = []
-    for note_filepath in vault_dirpath.rglob("*.md"):
-        rel_parts = note_filepath.relative_to(vault_dirpath).parts
-        if rel_parts and rel_parts[0] in cfg.exclude_dirnames:
-            continue
-        filepaths.append(note_filepath)
-
-    total_notes = len(filepaths)
+    if note_files is None:
+        note_files = VaultCrawler(vault_dirpath, cfg.exclude_dirnames).crawl()
+
+    total_notes = len(note_files)
     print(f"Indexing notes under: {vault_dirpath} (total: {total_notes})")
 
     # インデックスの設定と作成
     threads = cfg.indexing_threads or (os.cpu_count() or 1)
     indexer = pt.IterDictIndexer(
         str(index_dir.resolve()),
-        meta={"docno": 8, "linkpath": 128, "title_0": 128, "body_0": 1024},
+        meta=PASSAGE_META if cfg.passage_mode else NOTE_META,
         text_attrs=["title", "body"],
         fields=True,
         # TerrierIndexer parameter
@@ -83,23 +289,57 @@ def build_index_from_notes(
         threads=threads,
     )
 
+    # 前回の解析結果（上書きされる前に読み込んでおく）
+    analysis_cache = None
+    analysis_writer = None
+    if cfg.analysis_cache:
+        settings = analysis_settings(cfg)
+        analysis_cache = load_analysis_cache(cfg.index_dirpath, settings)
+        analysis_writer = AnalysisCacheWriter(index_dir, settings)
+    else:
+        # 同じディレクトリに作り直す場合、古い解析結果が新しい索引のものとして残らないようにする
+        (index_dir / ANALYSIS_CACHE_FILENAME).unlink(missing_ok=True)
+
     # インデックス生成
     analyzer = create_japanese_analyzer(cfg.stopwords_filepath)
     md_parser = create_md_parser()
-    index_ref = indexer.index(
-        generate_notes(
-            filepaths, cfg.vault_dirpath, analyzer, md_parser, progress_callback
-        ),
+    docs = generate_notes(
+        note_files,
+        cfg.vault_dirpath,
+        analyzer,
+        md_parser,
+        progress_callback,
+        passage_mode=cfg.passage_mode,
+        passage_length=cfg.passage_length,
+        passage_stride=cfg.passage_stride,
+        analysis_cache=analysis_cache,
+        analysis_writer=analysis_writer,
     )
+    if phase_callback:
+        docs = _with_phase(docs, phase_callback, "parse/analyze")
+    try:
+        index_ref = indexer.index(docs)
+    except BaseException:
+        if analysis_writer:
+            analysis_writer.discard()
+        raise
+    if analysis_writer:
+        analysis_writer.commit()
+    if phase_callback:
+        phase_callback("terrier index")
     if hasattr(indexer, "close"):
         try:
             indexer.close()
         except Exception:
             pass
     index = pt.IndexFactory.of(index_ref)
+    write_index_stats(index_dir, total_notes)
 
     # 統計情報を表示
-    print("Index built.")
+    if analysis_writer:
+        print(f"Index built. (analyzed {analysis_writer.analyzed} notes, reused {analysis_writer.reused})")
+    else:
+        print("Index built.")
     print(index.getCollectionStatistics().toString())
 
     # 明示的にクローズしてファイルハンドルを解放（Windows のリネーム対策）
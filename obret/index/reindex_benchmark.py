@@ -0,0 +1,91 @@
+"""
+再インデックス中の検索レイテンシと、再インデックス後の RSS を計測する。
+
+    uv run python -m obret.index.reindex_benchmark --config my_config.yaml --mode process
+    uv run python -m obret.index.reindex_benchmark --config my_config.yaml --mode thread
+
+RSS は計測ごとにプロセスを分けて比較すること（--mode を変えて 2 回実行する）。
+"""
+
+import argparse
+import asyncio
+import gc
+import threading
+import time
+
+import numpy as np
+from fastapi import FastAPI
+
+from obret.api.main import lifespan, rebuild_index
+from obret.utils.process import current_rss_mb
+
+DEFAULT_QUERIES = ["検索", "会議", "メモ", "python", "設計 方針"]
+
+
+def _search_loop(app: FastAPI, queries: list[str], stop: threading.Event, latencies: list, rejected: list):
+    i = 0
+    while not stop.is_set():
+        pipeline = app.state.pipeline
+        if app.state.swap_in_progress or pipeline is None:
+            rejected.append(1)
+            time.sleep(0.01)
+            continue
+        start = time.perf_counter()
+        pipeline.search(queries[i % len(queries)])
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+async def run(config_path: str | None, isolated: bool, queries: list[str]):
+    app = FastAPI()
+    async with lifespan(app, config_path):
+        app.state.config.isolated_indexing = isolated
+
+        # ベースライン（再インデックスなし）
+        baseline = []
+        for q in queries * 20:
+            start = time.perf_counter()
+            app.state.pipeline.search(q)
+            baseline.append(time.perf_counter() - start)
+
+        gc.collect()
+        rss_before = current_rss_mb()
+
+        stop = threading.Event()
+        latencies: list[float] = []
+        rejected: list[int] = []
+        searcher = threading.Thread(
+            target=_search_loop, args=(app, queries, stop, latencies, rejected), daemon=True
+        )
+        searcher.start()
+        start = time.perf_counter()
+        await rebuild_index(app, reason="benchmark")
+        reindex_seconds = time.perf_counter() - start
+        stop.set()
+        searcher.join()
+
+        gc.collect()
+        rss_after = current_rss_mb()
+
+    def _fmt(values):
+        ms = np.array(values) * 1000
+        return f"p50={np.percentile(ms, 50):.1f}ms p99={np.percentile(ms, 99):.1f}ms (n={len(ms)})"
+
+    print(f"mode: {'process' if isolated else 'thread'}")
+    print(f"reindex time: {reindex_seconds:.1f} s")
+    print(f"search latency (idle):       {_fmt(baseline)}")
+    if latencies:
+        print(f"search latency (reindexing): {_fmt(latencies)}")
+    print(f"unavailable polls (swap window, 10ms each): {len(rejected)}")
+    print(f"RSS before reindex: {rss_before:.1f} MB")
+    print(f"RSS after reindex:  {rss_after:.1f} MB (+{rss_after - rss_before:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark search latency during reindex")
+    parser.add_argument("--config", "-c", type=str, help="Path to the configuration file")
+    parser.add_argument("--mode", choices=["process", "thread"], default="process")
+    parser.add_argument("--query", "-q", action="append", help="Query to replay (repeatable)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.config, args.mode == "process", args.query or DEFAULT_QUERIES))
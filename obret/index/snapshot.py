@@ -0,0 +1,190 @@
+"""
+構築済みの索引をスナップショットとして書き出し、別のマシンで復元する。
+
+    uv run python -m obret.index.snapshot export --config my_config.yaml --output vault.obret.tar.gz
+    uv run python -m obret.index.snapshot import --config my_config.yaml --input vault.obret.tar.gz
+
+スナップショットは gzip 圧縮した tar で、manifest.json（各ファイルの SHA-256 とノートの
+内容ハッシュ）と index/ 以下の Terrier の索引・解析結果を含む。復元時は全ファイルの
+チェックサムを検証してから索引ディレクトリを置き換える。
+"""
+
+import argparse
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import shutil
+import tarfile
+from pathlib import Path
+
+from obret.config.config_loader import load_base_config
+from obret.index.mecab import ANALYSIS_CACHE_FILENAME, analysis_settings
+from obret.utils.crawler import NoteFile, VaultCrawler
+from obret.utils.pyterrier_utils import index_ready
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+INDEX_PREFIX = "index/"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_file(filepath: Path) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_note_hashes(index_dir: Path) -> tuple[dict | None, dict[str, str]]:
+    # 解析結果のサイドカーから、解析設定と各ノートの内容ハッシュだけを取り出す
+    cache_filepath = index_dir / ANALYSIS_CACHE_FILENAME
+    if not cache_filepath.is_file():
+        return None, {}
+    hashes = {}
+    with gzip.open(cache_filepath, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        for line in f:
+            record = json.loads(line)
+            hashes[record["linkpath"]] = record["hash"]
+    return header.get("settings"), hashes
+
+
+def export_snapshot(index_dirpath: str | Path, output_filepath: str | Path) -> dict:
+    """索引ディレクトリを 1 つのスナップショットファイルに書き出し、manifest を返す"""
+    index_dir = Path(index_dirpath).resolve()
+    if not index_ready(index_dir):
+        raise FileNotFoundError(f"No index to export at {index_dir}")
+
+    files = sorted(p for p in index_dir.rglob("*") if p.is_file())
+    settings, note_hashes = _read_note_hashes(index_dir)
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "files": {p.relative_to(index_dir).as_posix(): _sha256_file(p) for p in files},
+        "analysis_settings": settings,
+        "notes": note_hashes,
+    }
+
+    output_filepath = Path(output_filepath)
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_filepath = output_filepath.with_name(output_filepath.name + ".tmp")
+    with tarfile.open(tmp_filepath, "w:gz", compresslevel=6) as tar:
+        data = json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        info.mtime = int(datetime.datetime.now().timestamp())
+        tar.addfile(info, io.BytesIO(data))
+        for p in files:
+            tar.add(p, arcname=INDEX_PREFIX + p.relative_to(index_dir).as_posix(), recursive=False)
+    tmp_filepath.replace(output_filepath)
+    return manifest
+
+
+def import_snapshot(snapshot_filepath: str | Path, index_dirpath: str | Path) -> dict:
+    """
+    スナップショットを検証しながら展開し、索引ディレクトリを置き換えて manifest を返す。
+    チェックサムが合わない・ファイルが欠けている場合は既存の索引に触れずに ValueError を送出する。
+    """
+    index_dir = Path(index_dirpath).resolve()
+    restore_dir = index_dir.with_name(index_dir.name + ".restore")
+    backup_dir = index_dir.with_name(index_dir.name + ".old")
+    if restore_dir.exists():
+        shutil.rmtree(restore_dir)
+    restore_dir.mkdir(parents=True)
+
+    try:
+        with tarfile.open(snapshot_filepath, "r:*") as tar:
+            manifest_file = tar.extractfile(MANIFEST_NAME)
+            if manifest_file is None:
+                raise ValueError("Snapshot has no manifest")
+            manifest = json.load(manifest_file)
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+
+            expected = manifest["files"]
+            restored = set()
+            for member in tar:
+                if not member.isfile() or not member.name.startswith(INDEX_PREFIX):
+                    continue
+                name = member.name[len(INDEX_PREFIX) :]
+                if name not in expected:
+                    raise ValueError(f"Unexpected file in snapshot: {name}")
+                target = (restore_dir / name).resolve()
+                if not target.is_relative_to(restore_dir):
+                    raise ValueError(f"Unsafe path in snapshot: {member.name}")
+                target.parent.mkdir(parents=True, exist_ok=True)
+
+                digest = hashlib.sha256()
+                source = tar.extractfile(member)
+                with open(target, "wb") as out:
+                    while chunk := source.read(CHUNK_SIZE):
+                        digest.update(chunk)
+                        out.write(chunk)
+                if digest.hexdigest() != expected[name]:
+                    raise ValueError(f"Checksum mismatch for {name}")
+                restored.add(name)
+
+            missing = set(expected) - restored
+            if missing:
+                raise ValueError(f"Snapshot is missing {len(missing)} files (e.g. {sorted(missing)[0]})")
+    except Exception:
+        shutil.rmtree(restore_dir, ignore_errors=True)
+        raise
+
+    if backup_dir.exists():
+        shutil.rmtree(backup_dir)
+    if index_dir.exists():
+        index_dir.rename(backup_dir)
+    restore_dir.rename(index_dir)
+    return manifest
+
+
+def stale_notes(manifest: dict, note_files: list[NoteFile], vault_dirpath: str | Path) -> list[str]:
+    """スナップショット作成後に追加・変更・削除されたノートの相対パスを返す"""
+    vault_dirpath = Path(vault_dirpath).resolve()
+    snapshot_hashes = manifest.get("notes", {})
+    stale = []
+    seen = set()
+    for note_file in note_files:
+        key = note_file.path.relative_to(vault_dirpath).as_posix()
+        seen.add(key)
+        if snapshot_hashes.get(key) != hashlib.sha256(note_file.path.read_bytes()).hexdigest():
+            stale.append(key)
+    stale.extend(sorted(set(snapshot_hashes) - seen))
+    return stale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import index snapshots")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--config", "-c", type=str, help="Path to the configuration file")
+    parser.add_argument("--output", "-o", type=str, help="Snapshot file to write (export)")
+    parser.add_argument("--input", "-i", type=str, help="Snapshot file to restore (import)")
+    args = parser.parse_args()
+
+    cfg = load_base_config(args.config) if args.config else load_base_config()
+    if args.command == "export":
+        output = args.output or cfg.snapshot_filepath
+        if not output:
+            parser.error("--output or snapshot_filepath in config is required")
+        manifest = export_snapshot(cfg.index_dirpath, output)
+        print(f"Exported {len(manifest['files'])} files ({len(manifest['notes'])} notes) to {output}")
+        if manifest["analysis_settings"] is None:
+            print("Warning: the index has no analysis cache; restoring will reindex every note (enable analysis_cache)")
+    else:
+        source = args.input or cfg.snapshot_filepath
+        if not source:
+            parser.error("--input or snapshot_filepath in config is required")
+        manifest = import_snapshot(source, cfg.index_dirpath)
+        print(f"Restored snapshot created at {manifest['created']} into {cfg.index_dirpath}")
+        if manifest.get("analysis_settings") is None:
+            print("Snapshot has no note hashes; all notes will be re-analyzed on the next reindex")
+        elif manifest.get("analysis_settings") != analysis_settings(cfg):
+            print("Analysis settings differ from the snapshot; all notes will be re-analyzed on the next reindex")
+        else:
+            crawler = VaultCrawler(cfg.vault_dirpath, cfg.exclude_dirnames)
+            stale = stale_notes(manifest, crawler.crawl(), crawler.root)
+            print(f"{len(stale)} notes differ from the snapshot and will be re-analyzed on the next reindex")
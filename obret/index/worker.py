@@ -0,0 +1,166 @@
+import multiprocessing as mp
+import queue
+import time
+from pathlib import Path
+from typing import Callable
+
+from obret.config.schema import BaseConfig
+from obret.utils.crawler import NoteFile
+from obret.utils.profiling import PhaseTracker, dump_profile
+
+# JVM を抱えたプロセスを fork すると壊れるので常に spawn で起動する
+_MP_CONTEXT = mp.get_context("spawn")
+
+
+def _run_build(
+    cfg: BaseConfig,
+    target_dirpath: str,
+    messages,
+    note_files: list[NoteFile] | None,
+    profile: bool,
+) -> None:
+    """ワーカープロセス側のエントリポイント（進捗と結果をキュー経由で親に返す）"""
+    import cProfile
+
+    import pyterrier as pt
+
+    from obret.index.mecab import build_index_from_notes
+
+    if not pt.java.started():
+        pt.java.init()
+
+    last_percent = -1
+
+    def _progress(done: int, total: int):
+        # 1% 刻みに間引いてキューの往復を抑える
+        nonlocal last_percent
+        percent = int(done * 100 / total) if total > 0 else 100
+        if percent != last_percent:
+            last_percent = percent
+            messages.put(("progress", done, total))
+
+    profiler = cProfile.Profile() if profile else None
+    tracker = PhaseTracker("worker") if profile else None
+    error = None
+    try:
+        if profiler:
+            profiler.enable()
+        build_index_from_notes(
+            cfg,
+            target_dirpath=target_dirpath,
+            progress_callback=_progress,
+            note_files=note_files,
+            phase_callback=tracker.phase if tracker else None,
+        )
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        # 親は結果（done/error）を受け取った時点で待機を終えるので、プロファイルは必ずその前に送る
+        if profiler:
+            profiler.disable()
+            messages.put(("profile", dump_profile(profiler), tracker.stop()))
+        messages.put(("error", error) if error is not None else ("done", target_dirpath))
+
+
+class IndexBuildProcess:
+    """
+    build_index_from_notes を別プロセスで実行する。
+    MeCab/mistune の処理がサーバーの GIL を奪わず、構築時のメモリもプロセス終了と共に解放される。
+    親プロセスには進捗と完成したインデックスのパスのみが返る。
+    """
+
+    def __init__(
+        self,
+        cfg: BaseConfig,
+        target_dirpath: str | Path | None = None,
+        progress_callback: Callable[[int, int], None] | None = None,
+        note_files: list[NoteFile] | None = None,
+        profile: bool = False,
+    ):
+        self.target_dirpath = Path(target_dirpath) if target_dirpath else Path(cfg.index_dirpath)
+        self.progress_callback = progress_callback
+        # profile=True の場合、ワーカーの cProfile 結果と tracemalloc のフェーズ記録が入る
+        self.profile: tuple[bytes, list[dict]] | None = None
+        self._messages = _MP_CONTEXT.Queue()
+        self._process = _MP_CONTEXT.Process(
+            target=_run_build,
+            args=(cfg, str(self.target_dirpath.resolve()), self._messages, note_files, profile),
+            name="obret-index-build",
+            daemon=True,
+        )
+        self._cancelled = False
+
+    def start(self) -> "IndexBuildProcess":
+        self._process.start()
+        return self
+
+    def wait(self, poll_interval: float = 0.5, exit_timeout: float = 30.0) -> Path:
+        """
+        ビルド完了まで待ち、完成したインデックスのパスを返す（ブロッキング）。
+        結果を受け取った後、exit_timeout 秒以内に終了しないワーカーは強制終了する。
+        """
+        error = None
+        result = None
+
+        def _handle(message):
+            nonlocal error, result
+            kind = message[0]
+            if kind == "progress" and self.progress_callback:
+                self.progress_callback(message[1], message[2])
+            elif kind == "profile":
+                self.profile = (message[1], message[2])
+            elif kind == "done":
+                result = Path(message[1])
+            elif kind == "error":
+                error = message[1]
+
+        while result is None and error is None:
+            try:
+                message = self._messages.get(timeout=poll_interval)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    # 終了直前に積まれたメッセージを取りこぼさないよう一度だけ再確認
+                    try:
+                        message = self._messages.get_nowait()
+                    except queue.Empty:
+                        break
+                else:
+                    continue
+            _handle(message)
+
+        # 子プロセスはキューに積んだメッセージがパイプに書き出されるまで終了できないので、終了を待つ間も読み続ける。
+        # JVM の終了処理が長引くことがあるので、成功・失敗どちらの経路でも待ち時間を区切って強制終了する
+        deadline = time.monotonic() + exit_timeout
+        while self._process.is_alive() and time.monotonic() < deadline:
+            try:
+                _handle(self._messages.get(timeout=poll_interval))
+            except queue.Empty:
+                continue
+        self._stop()
+        if self._cancelled:
+            raise RuntimeError("Index build was cancelled")
+        if error is not None:
+            raise RuntimeError(f"Index build failed in worker: {error}")
+        if result is None:
+            raise RuntimeError(f"Index build worker exited with code {self._process.exitcode}")
+        return result
+
+    def run(self) -> Path:
+        return self.start().wait()
+
+    def cancel(self, timeout: float = 5.0):
+        """実行中のビルドを中断する（サーバー停止時など）"""
+        self._cancelled = True
+        self._stop(timeout)
+
+    def _stop(self, timeout: float = 5.0):
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
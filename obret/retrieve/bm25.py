@@ -1,15 +1,41 @@
 import pyterrier as pt
 
+from obret.utils.pyterrier_utils import is_passage_index
+
+# パッセージ索引で集約前に取得するパッセージ数
+PASSAGE_CANDIDATES = 100
+
+
+def max_passage():
+    """
+    ノートごとに最大スコアのパッセージを残す。pt.text.max_passage は空の結果（ヒットなし）で
+    例外を送出するので、その場合は集約せずにそのまま返す。
+    """
+    aggregate = pt.text.max_passage()
+    return pt.apply.generic(lambda df: df if df.empty else aggregate.transform(df))
+
 
 # タイトル:本文 = 2:1 の重み付けをしたBM25F
 def build_pipeline(index, analyzer):
+    retriever = pt.terrier.Retriever(
+        index,
+        wmodel="BM25F",
+        controls={"w.0": 2, "w.1": 1},
+    )
+    if is_passage_index(index):
+        # パッセージ単位で検索し、ノートごとに最大スコアのパッセージを残す
+        pipeline = (
+            pt.apply.query(lambda row: analyzer(row.query))
+            >> retriever % PASSAGE_CANDIDATES
+            >> pt.text.get_text(index)
+            >> max_passage()
+            % 10
+        )
+        return pipeline
+
     pipeline = (
         pt.apply.query(lambda row: analyzer(row.query))
-        >> pt.terrier.Retriever(
-            index,
-            wmodel="BM25F",
-            controls={"w.0": 2, "w.1": 1},
-        )
+        >> retriever
         % 10
         >> pt.text.get_text(index)
     )
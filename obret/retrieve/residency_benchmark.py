@@ -0,0 +1,113 @@
+"""
+索引の常駐方法（index_residency）ごとの RSS と検索レイテンシを計測する。
+
+    uv run python -m obret.retrieve.residency_benchmark --config my_config.yaml
+
+モードごとに新しいプロセスを起動し、索引を開く前後の RSS、最初の検索（cold）と
+2 回目以降の検索（warm）のレイテンシを表示する。cold は JVM と索引構造が未使用の状態を指し、
+OS のページキャッシュは破棄しないので、完全なコールドスタートを測る場合は事前にキャッシュを落とすこと。
+"""
+
+import argparse
+import multiprocessing as mp
+import time
+from pathlib import Path
+
+import numpy as np
+
+from obret.config.config_loader import load_base_config
+from obret.utils.pyterrier_utils import INDEX_RESIDENCY_STRUCTURES
+
+DEFAULT_QUERIES = ["検索", "会議", "メモ", "python", "設計 方針"]
+
+
+def _measure(config_path: str | None, residency: str, queries: list[str], repeat: int, results):
+    import pyterrier as pt
+
+    from obret.retrieve.bm25 import build_pipeline
+    from obret.utils.process import current_rss_mb
+    from obret.utils.pyterrier_utils import create_japanese_analyzer, open_index
+
+    cfg = load_base_config(config_path) if config_path else load_base_config()
+    if not pt.java.started():
+        pt.java.init()
+    analyzer = create_japanese_analyzer(cfg.stopwords_filepath)
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    index = open_index(Path(cfg.index_dirpath).resolve(), residency)
+    open_seconds = time.perf_counter() - start
+    pipeline = build_pipeline(index, analyzer)
+    rss_open = current_rss_mb()
+
+    cold = []
+    for q in queries:
+        start = time.perf_counter()
+        pipeline.search(q)
+        cold.append(time.perf_counter() - start)
+
+    warm = []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            pipeline.search(q)
+            warm.append(time.perf_counter() - start)
+
+    results.put(
+        {
+            "residency": residency,
+            "open_seconds": open_seconds,
+            "rss_before": rss_before,
+            "rss_open": rss_open,
+            "rss_after": current_rss_mb(),
+            "cold": cold,
+            "warm": warm,
+        }
+    )
+
+
+def main(config_path: str | None, residencies: list[str], queries: list[str], repeat: int):
+    ctx = mp.get_context("spawn")
+    for residency in residencies:
+        results = ctx.Queue()
+        process = ctx.Process(target=_measure, args=(config_path, residency, queries, repeat, results))
+        process.start()
+        r = results.get()
+        process.join()
+
+        cold_ms = np.array(r["cold"]) * 1000
+        warm_ms = np.array(r["warm"]) * 1000
+        print("-" * 50)
+        print(f"residency: {residency}")
+        print(f"  open: {r['open_seconds']:.2f} s")
+        print(
+            f"  RSS: before={r['rss_before']:.1f} MB, opened={r['rss_open']:.1f} MB, "
+            f"after queries={r['rss_after']:.1f} MB"
+        )
+        print(f"  cold: first={cold_ms[0]:.1f}ms mean={cold_ms.mean():.1f}ms")
+        print(
+            f"  warm: p50={np.percentile(warm_ms, 50):.1f}ms "
+            f"p99={np.percentile(warm_ms, 99):.1f}ms (n={len(warm_ms)})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark index residency modes")
+    parser.add_argument("--config", "-c", type=str, help="Path to the configuration file")
+    parser.add_argument(
+        "--residency",
+        "-r",
+        action="append",
+        choices=list(INDEX_RESIDENCY_STRUCTURES),
+        help="Residency mode to measure (repeatable, default: all)",
+    )
+    parser.add_argument("--query", "-q", action="append", help="Query to replay (repeatable)")
+    parser.add_argument("--repeat", "-n", type=int, default=20, help="Warm passes over the queries")
+    args = parser.parse_args()
+
+    main(
+        args.config,
+        args.residency or list(INDEX_RESIDENCY_STRUCTURES),
+        args.query or DEFAULT_QUERIES,
+        args.repeat,
+    )
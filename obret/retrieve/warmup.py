@@ -0,0 +1,28 @@
+import time
+from collections import Counter
+from typing import Iterable
+
+
+def select_warmup_queries(recent_queries: Iterable[str], limit: int) -> list[str]:
+    """
+    直近のクエリから再生するものを選ぶ。
+    出現回数の多い順（同数なら新しい順）に重複を除いて最大 limit 件を返す。
+    """
+    if limit <= 0:
+        return []
+    queries = list(recent_queries)
+    counts = Counter(queries)
+    last_seen = {q: i for i, q in enumerate(queries)}
+    ranked = sorted(counts, key=lambda q: (-counts[q], -last_seen[q]))
+    return ranked[:limit]
+
+
+def warm_up(pipeline, queries: list[str]) -> float:
+    """クエリを再生して索引を温め、かかった秒数を返す（個々の失敗は無視する）"""
+    start = time.perf_counter()
+    for q in queries:
+        try:
+            pipeline.search(q)
+        except Exception as e:
+            print(f"Warning: warm-up query failed ({q!r}): {e}")
+    return time.perf_counter() - start
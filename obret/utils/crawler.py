@@ -0,0 +1,105 @@
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+
+class NoteFile(NamedTuple):
+    path: Path
+    stat: os.stat_result
+
+
+def is_excluded(relative_dirpath: str, patterns: Iterable[str]) -> bool:
+    """
+    vault からの相対パス（"/" 区切り）が除外パターンに一致するか。
+    "templates" や "archive/2020" は vault 直下からのパスと照合し、glob（"*.bak"）も使える。
+    "**/.git" のように "**/" で始まるパターンは任意の深さのディレクトリ名に一致する。
+    """
+    for pattern in patterns:
+        pattern = pattern.strip("/")
+        if pattern.startswith("**/"):
+            name_pattern = pattern[3:]
+            if fnmatchcase(relative_dirpath, name_pattern) or fnmatchcase(
+                relative_dirpath, "*/" + name_pattern
+            ):
+                return True
+        elif fnmatchcase(relative_dirpath, pattern):
+            return True
+    return False
+
+
+class VaultCrawler:
+    """
+    os.scandir で vault を走査して Markdown ファイルを集める。
+    除外ディレクトリには降りず、走査時に得た stat をそのまま返す。
+    前回から mtime が変わっていないディレクトリは一覧を取り直さず、前回の一覧を使う
+    （ファイルの追加・削除・改名はディレクトリの mtime を更新するため）。
+    """
+
+    def __init__(self, vault_dirpath: str | Path, exclude_dirnames: Iterable[str] = ()):
+        self.root = Path(vault_dirpath).resolve()
+        self.exclude_dirnames = list(exclude_dirnames)
+        # dirpath -> (ディレクトリの mtime_ns, サブディレクトリ名, Markdown ファイル名)
+        self._listings: dict[str, tuple[int, list[str], list[str]]] = {}
+
+    def set_exclude_dirnames(self, exclude_dirnames: Iterable[str]):
+        exclude_dirnames = list(exclude_dirnames)
+        if exclude_dirnames != self.exclude_dirnames:
+            self.exclude_dirnames = exclude_dirnames
+            self._listings.clear()
+
+    def _scan(self, dirpath: str, relative_dirpath: str, notes: list[NoteFile]):
+        subdirs: list[str] = []
+        files: list[str] = []
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    child = f"{relative_dirpath}/{entry.name}" if relative_dirpath else entry.name
+                    if not is_excluded(child, self.exclude_dirnames):
+                        subdirs.append(entry.name)
+                elif entry.name.endswith(".md") and entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append(entry.name)
+                    notes.append(NoteFile(Path(entry.path), stat))
+        return subdirs, files
+
+    def crawl(self) -> list[NoteFile]:
+        notes: list[NoteFile] = []
+        listings: dict[str, tuple[int, list[str], list[str]]] = {}
+        stack = [(str(self.root), "")]
+        while stack:
+            dirpath, relative_dirpath = stack.pop()
+            try:
+                mtime_ns = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+
+            cached = self._listings.get(dirpath)
+            if cached and cached[0] == mtime_ns:
+                _, subdirs, files = cached
+                # 一覧は使い回すが、内容の更新を拾うためにファイルの stat は取り直す
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        notes.append(NoteFile(Path(path), os.stat(path)))
+                    except OSError:
+                        continue
+            else:
+                try:
+                    subdirs, files = self._scan(dirpath, relative_dirpath, notes)
+                except OSError as e:
+                    print(f"Failed to scan {dirpath}: {e}")
+                    continue
+            listings[dirpath] = (mtime_ns, subdirs, files)
+
+            for name in subdirs:
+                child = f"{relative_dirpath}/{name}" if relative_dirpath else name
+                stack.append((os.path.join(dirpath, name), child))
+
+        # 今回辿らなかったディレクトリ（削除・除外されたもの）はキャッシュから外す
+        self._listings = listings
+        notes.sort(key=lambda note: note.path)
+        return notes
@@ -1,3 +1,4 @@
+import os
 import re
 from pathlib import Path
 
@@ -6,19 +7,35 @@ from yaml import YAMLError
 
 
 class ObsidianNote:
-    def __init__(self, vault_dirpath: str | Path, note_filepath: str | Path):
-        self.vault_path = Path(vault_dirpath).resolve()
-        self.note_path = Path(note_filepath).resolve()
+    def __init__(
+        self,
+        vault_dirpath: str | Path,
+        note_filepath: str | Path,
+        stat: os.stat_result | None = None,
+        content: str | None = None,
+    ):
+        if stat is None:
+            self.vault_path = Path(vault_dirpath).resolve()
+            self.note_path = Path(note_filepath).resolve()
 
-        if not self.note_path.is_file():
-            raise FileNotFoundError(f"Note file not found: {self.note_path}")
+            if not self.note_path.is_file():
+                raise FileNotFoundError(f"Note file not found: {self.note_path}")
+        else:
+            # VaultCrawler から解決済みのパスと stat を受け取った場合は再解決・再 stat しない
+            self.vault_path = Path(vault_dirpath)
+            self.note_path = Path(note_filepath)
+        self.stat = stat
 
         # 相対パス（vaultからの相対パス）
         self.relative_path = self.note_path.relative_to(self.vault_path)
 
-        # ファイル内容の読み込み
-        with open(self.note_path, "r", encoding="utf-8") as f:
-            text = f.read()
+        # ファイル内容の読み込み（読み込み済みの内容を渡された場合はそれを使う）
+        if content is None:
+            with open(self.note_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        else:
+            # テキストモードで開いた場合と同じく改行を \n に揃える
+            text = content.replace("\r\n", "\n").replace("\r", "\n")
 
         # frontmatter と body を分割して格納
         self.frontmatter = {}
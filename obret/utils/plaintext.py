@@ -0,0 +1,157 @@
+import re
+from bisect import bisect_right
+from html import unescape
+
+import mistune
+from mistune.core import BaseRenderer
+
+# [[リンク]] / [[リンク|別名]]。テーブル内では Obsidian の流儀どおり [[リンク\|別名]] も受け付ける
+WIKILINK_PATTERN = r"\[\[(?P<wikilink_target>[^\]|\n]+?)(?:\\?\|(?P<wikilink_alias>[^\]\n]+))?\]\]"
+
+HTML_COMMENT_REGEX = re.compile(r"<!--.*?-->", re.DOTALL)
+HTML_TAG_REGEX = re.compile(r"<[^>]*>")
+
+# 前後に区切りを挟まないインライン要素（それ以外はブロックとして末尾に改行を出す）
+_INLINE_TOKENS = {
+    "text",
+    "emphasis",
+    "strong",
+    "link",
+    "image",
+    "codespan",
+    "inline_html",
+    "strikethrough",
+    "inline_math",
+    "wikilink",
+}
+# 子要素を持たず raw をそのまま本文とするトークン
+_RAW_TOKENS = {"codespan", "block_code", "inline_math", "block_math"}
+
+
+def parse_wikilink(inline, m, state) -> int:
+    state.append_token(
+        {
+            "type": "wikilink",
+            "raw": m.group("wikilink_alias") or m.group("wikilink_target"),
+        }
+    )
+    return m.end()
+
+
+def wikilink(md):
+    """Obsidian の wikilink を表示テキスト（別名があれば別名）のトークンにする mistune プラグイン"""
+    md.inline.register("wikilink", WIKILINK_PATTERN, parse_wikilink, before="link")
+
+
+def strip_html(html: str) -> str:
+    text = HTML_TAG_REGEX.sub("", HTML_COMMENT_REGEX.sub("", html))
+    return unescape(text) if "&" in text else text
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    mistune の AST から直接プレーンテキストを組み立てるレンダラー。
+    HTML を経由せず、ブロックの区切りにだけ改行を挟んだ断片のリストを返す。
+    各断片は (表示テキスト, ソース上で探すための raw) の組。
+    """
+
+    NAME = "plaintext"
+
+    def __call__(self, tokens, state) -> list[tuple[str, str]]:
+        segments: list[tuple[str, str]] = []
+        self._walk(tokens, segments)
+        return segments
+
+    def _walk(self, tokens, segments: list[tuple[str, str]]):
+        for token in tokens:
+            kind = token["type"]
+            children = token.get("children")
+            if children is not None:
+                # image の alt は HTML 経由の従来出力と同じく本文に含めない
+                if kind != "image":
+                    self._walk(children, segments)
+            elif kind == "text":
+                raw = token["raw"]
+                segments.append((unescape(raw) if "&" in raw else raw, raw))
+            elif kind in _RAW_TOKENS or kind == "wikilink":
+                raw = token["raw"]
+                segments.append((raw, raw))
+            elif kind == "inline_html" or kind == "block_html":
+                raw = token["raw"]
+                segments.append((strip_html(raw), ""))
+            elif kind == "linebreak" or kind == "softbreak":
+                segments.append(("\n", ""))
+                continue
+
+            if kind not in _INLINE_TOKENS:
+                segments.append(("\n", ""))
+
+
+def create_plaintext_markdown() -> mistune.Markdown:
+    return mistune.create_markdown(
+        escape=False,
+        hard_wrap=True,
+        renderer=PlainTextRenderer(),
+        plugins=["strikethrough", "table", "task_lists", "math", wikilink],
+    )
+
+
+def join_segments(segments: list[tuple[str, str]]) -> str:
+    """断片を連結し、連続する空白を 1 つにまとめる"""
+    return " ".join("".join(text for text, _ in segments).split())
+
+
+def join_segments_with_offsets(
+    segments: list[tuple[str, str]], source: str
+) -> tuple[str, list[tuple[int, int]]]:
+    """
+    join_segments と同じテキストに加え、(プレーンテキスト上の位置, ソース上の位置) の
+    アンカー列を返す。アンカーは各断片の先頭に置かれ、断片の raw をソースの前方から
+    順に探して対応付ける（見つからない断片は対応なしとして飛ばす）。
+    """
+    parts: list[str] = []
+    offsets: list[tuple[int, int]] = []
+    length = 0
+    pending_space = False
+    cursor = 0
+    for text, raw in segments:
+        words = text.split()
+        if not words:
+            pending_space = pending_space or bool(text)
+            continue
+        if pending_space or text[0].isspace():
+            if length:
+                parts.append(" ")
+                length += 1
+        if raw:
+            found = source.find(raw, cursor)
+            if found >= 0:
+                lead = len(raw) - len(raw.lstrip())
+                offsets.append((length, found + lead))
+                cursor = found + len(raw)
+        chunk = " ".join(words)
+        parts.append(chunk)
+        length += len(chunk)
+        pending_space = text[-1].isspace()
+    return "".join(parts), offsets
+
+
+def to_source_offset(offsets: list[tuple[int, int]], position: int) -> int | None:
+    """プレーンテキスト上の位置を、直前のアンカーを基準にソース上の位置へ換算する"""
+    i = bisect_right(offsets, (position, float("inf"))) - 1
+    if i < 0:
+        return None
+    plain_pos, source_pos = offsets[i]
+    return source_pos + (position - plain_pos)
+
+
+def create_plaintext_parser(with_offsets: bool = False):
+    """
+    Markdown をプレーンテキストに変換する関数を返す。
+    with_offsets=True の場合は (テキスト, アンカー列) を返し、to_source_offset で
+    スニペットのハイライト位置を元の Markdown 上の位置に戻せる。
+    """
+    markdown = create_plaintext_markdown()
+    if with_offsets:
+        return lambda text: join_segments_with_offsets(markdown(text), text)
+    return lambda text: join_segments(markdown(text))
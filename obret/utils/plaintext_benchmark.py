@@ -0,0 +1,126 @@
+"""
+Markdown → プレーンテキスト変換の新旧比較。
+
+    uv run python -m obret.utils.plaintext_benchmark --config my_config.yaml
+    uv run python -m obret.utils.plaintext_benchmark --check
+
+Vault 内の全ノートについて、HTML + BeautifulSoup を経由する旧実装 (create_html_md_parser) と
+AST から直接生成する新実装 (create_md_parser) の出力を突き合わせ、それぞれの処理速度 (chars/s) を表示する。
+旧実装はインライン数式を \\( \\) 付きで出力し、ブロック数式の $$ を除去した跡に空白が重なるため、
+比較時はその差を無視する。
+
+--check は Vault を使わず、下記の入力例で新旧の出力が一致すること（意図した差分は新実装の期待値）を確認し、
+不一致があれば終了コード 1 を返す。
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from obret.config.config_loader import load_base_config
+from obret.utils.crawler import VaultCrawler
+from obret.utils.note import ObsidianNote
+from obret.utils.pyterrier_utils import create_html_md_parser, create_md_parser
+
+INLINE_MATH_DELIMITER_REGEX = re.compile(r"\\\(|\\\)")
+
+# 旧実装と同じ出力になるべき入力
+EQUIVALENCE_CASES = [
+    ("wikilink", "See [[東京]] and more"),
+    ("wikilink with alias", "See [[東京|Tokyo]] now"),
+    ("wikilink in table", "| a | b |\n|---|---|\n| [[x\\|y]] | 2 |"),
+    ("inline math", "式 $a+b$ です"),
+    ("block math", "前\n\n$$\nE = mc^2\n$$\n\n後"),
+    ("task list", "- [ ] todo\n- [x] done"),
+    ("entities", "A &amp; B &lt;c&gt; &copy;"),
+    ("inline html", "a <span>b</span> <br> c"),
+    ("images", "![alt text](img.png) and ![[embed.png]]"),
+    ("emphasis and links", "# H1\n\ntext **bold** _em_ ~~del~~ [link](http://x)"),
+    ("hard wrap", "line1\nline2"),
+    ("blockquote", "> quoted [[a|b]]"),
+]
+
+# 意図して旧実装と出力を変えた入力と、新実装の期待する出力
+KNOWN_DIFFERENCES = [
+    # 旧実装はリスト項目内のコードブロックを直前の語と連結していた（"itemcode"）
+    ("code block in list", "- item\n  ```\n  code\n  ```", "item code"),
+    # 旧実装はコードスパン内の [[x]] もリンクとして展開していた（"code x here"）
+    ("wikilink in code span", "`code [[x]]` here", "code [[x]] here"),
+]
+
+
+def normalize_legacy(text: str) -> str:
+    return " ".join(INLINE_MATH_DELIMITER_REGEX.sub("", text).split())
+
+
+def load_bodies(vault_dirpath: Path, exclude_dirnames: list[str]) -> list[str]:
+    crawler = VaultCrawler(vault_dirpath, exclude_dirnames)
+    return [
+        ObsidianNote(crawler.root, note_file.path, stat=note_file.stat).body
+        for note_file in crawler.crawl()
+    ]
+
+
+def measure(parser, bodies: list[str], repeat: int) -> tuple[list[str], float]:
+    outputs = [parser(body) for body in bodies]  # ウォームアップを兼ねる
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            parser(body)
+    elapsed = time.perf_counter() - start
+    total_chars = sum(len(body) for body in bodies) * repeat
+    return outputs, total_chars / elapsed if elapsed > 0 else float("inf")
+
+
+def check_equivalence() -> int:
+    """入力例で新旧の出力を比較し、不一致の件数を返す"""
+    legacy_parser = create_html_md_parser()
+    direct_parser = create_md_parser()
+    cases = [(name, source, normalize_legacy(legacy_parser(source))) for name, source in EQUIVALENCE_CASES]
+    cases += KNOWN_DIFFERENCES
+    failures = 0
+    for name, source, expected in cases:
+        direct = direct_parser(source)
+        if direct != expected:
+            failures += 1
+            print(f"FAIL {name}: source={source!r} expected={expected!r} direct={direct!r}")
+    print(f"{len(cases) - failures}/{len(cases)} cases match")
+    return failures
+
+
+def main(config_path: str | None, repeat: int, show: int):
+    cfg = load_base_config(config_path) if config_path else load_base_config()
+    bodies = load_bodies(Path(cfg.vault_dirpath), cfg.exclude_dirnames)
+    print(f"notes: {len(bodies)}, chars: {sum(len(b) for b in bodies)}")
+
+    legacy_outputs, legacy_speed = measure(create_html_md_parser(), bodies, repeat)
+    direct_outputs, direct_speed = measure(create_md_parser(), bodies, repeat)
+
+    mismatches = []
+    for body, legacy, direct in zip(bodies, legacy_outputs, direct_outputs):
+        if normalize_legacy(legacy) != direct:
+            mismatches.append((body, legacy, direct))
+
+    print(f"html + BeautifulSoup: {legacy_speed:,.0f} chars/s")
+    print(f"direct renderer:      {direct_speed:,.0f} chars/s ({direct_speed / legacy_speed:.1f}x)")
+    print(f"mismatched notes: {len(mismatches)} / {len(bodies)}")
+    for body, legacy, direct in mismatches[:show]:
+        print("-" * 50)
+        print(f"source: {body[:200]!r}")
+        print(f"legacy: {legacy[:200]!r}")
+        print(f"direct: {direct[:200]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare markdown-to-plaintext renderers")
+    parser.add_argument("--config", "-c", type=str, help="Path to the configuration file")
+    parser.add_argument("--repeat", "-n", type=int, default=3, help="Timed passes over the vault")
+    parser.add_argument("--show", type=int, default=5, help="Number of mismatches to print")
+    parser.add_argument("--check", action="store_true", help="Compare built-in cases only (no vault needed)")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check_equivalence() else 0)
+    main(args.config, args.repeat, args.show)
@@ -0,0 +1,13 @@
+import resource
+
+
+def current_rss_mb() -> float:
+    """現在の RSS (MB)。/proc が無い環境では最大 RSS で代用する"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
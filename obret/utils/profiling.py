@@ -0,0 +1,132 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import tracemalloc
+from typing import Callable
+
+
+class PhaseTracker:
+    """
+    tracemalloc のスナップショットをフェーズの区切りごとに取り、
+    直前のフェーズからの確保量の差分（上位 top 件）を記録する。
+    """
+
+    def __init__(self, process: str, top: int = 10):
+        self.process = process
+        self.top = top
+        self.phases: list[dict] = []
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        self._previous = tracemalloc.take_snapshot()
+
+    def phase(self, name: str):
+        snapshot = tracemalloc.take_snapshot()
+        diff = snapshot.compare_to(self._previous, "lineno")[: self.top]
+        current, peak = tracemalloc.get_traced_memory()
+        self.phases.append(
+            {
+                "process": self.process,
+                "phase": name,
+                "traced_mb": round(current / 1024 / 1024, 2),
+                "peak_mb": round(peak / 1024 / 1024, 2),
+                "top_diffs": [str(stat) for stat in diff],
+            }
+        )
+        self._previous = snapshot
+        tracemalloc.reset_peak()
+
+    def stop(self) -> list[dict]:
+        if self._started and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.phases
+
+
+class _StatsHolder:
+    # pstats.Stats は create_stats() と stats を持つオブジェクトから読み込める
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def dump_profile(profile: cProfile.Profile) -> bytes:
+    """cProfile の結果を .prof（pstats.dump_stats と同じ marshal 形式）のバイト列にする"""
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+
+def format_profile(data: bytes, limit: int = 40, sort: str = "cumulative") -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(_StatsHolder(marshal.loads(data)), stream=stream)
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+class Profiler:
+    """
+    /debug/profile から次の N 回の検索、または次の再インデックスのプロファイルを取る。
+    profiling_enabled が無効な場合は生成されず、検索・再インデックスの経路には何も足されない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.target: str | None = None
+        self.remaining = 0
+        self.requested = 0
+        self.stats: bytes | None = None
+        self.memory: list[dict] = []
+        self._profile: cProfile.Profile | None = None
+
+    def arm(self, target: str, count: int = 1):
+        with self._lock:
+            self.target = target
+            self.requested = count if target == "search" else 1
+            self.remaining = self.requested
+            self.stats = None
+            self.memory = []
+            self._profile = cProfile.Profile() if target == "search" else None
+
+    def status(self) -> dict:
+        return {
+            "target": self.target,
+            "requested": self.requested,
+            "remaining": self.remaining,
+            "ready": self.stats is not None,
+            "memory": self.memory,
+        }
+
+    def profile_search(self, func: Callable, *args, **kwargs):
+        if self.target != "search":
+            return func(*args, **kwargs)
+        with self._lock:
+            profile = self._profile
+            if self.target != "search" or profile is None:
+                return func(*args, **kwargs)
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.remaining -= 1
+                if self.remaining <= 0:
+                    self.stats = dump_profile(profile)
+                    self.target = None
+                    self._profile = None
+
+    def take_reindex(self) -> bool:
+        """次の再インデックスを計測するよう指定されていれば True を返し、指定を消費する"""
+        with self._lock:
+            if self.target != "reindex":
+                return False
+            self.target = None
+            return True
+
+    def finish_reindex(self, stats: bytes | None, memory: list[dict]):
+        with self._lock:
+            self.remaining = 0
+            self.stats = stats
+            self.memory = memory
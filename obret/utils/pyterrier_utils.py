@@ -1,10 +1,15 @@
+import json
 import re
+from functools import lru_cache
 from pathlib import Path
 
 import mistune
+import pyterrier as pt
 from bs4 import BeautifulSoup as bs
 from fugashi import Tagger
 
+from obret.utils.plaintext import create_plaintext_parser
+
 STOP_SYMBOLS = "[!\"#$%&'\\\\()*+,-./:;<=>?@[\\]^_`{|}~「」〔〕“”〈〉『』【】＆＊・（）＄＃＠。、？！｀＋￥％]"
 
 
@@ -29,6 +34,68 @@ def index_ready(index_dirpath: str | Path) -> bool:
         return False
 
 
+# 索引の常駐方法ごとにメモリへ読み込む構造
+# disk: 必要な部分だけをディスクから読む / preload: 辞書と転置索引をメモリに載せる / memory: 全構造をメモリに載せる
+INDEX_RESIDENCY_STRUCTURES = {
+    "disk": [],
+    "preload": ["lexicon", "inverted"],
+    "memory": ["lexicon", "inverted", "meta", "document", "direct"],
+}
+
+
+def open_index(index_dirpath: str | Path, residency: str = "disk"):
+    """
+    常駐方法を指定して Terrier の索引を開く。
+    preload/memory では最初の検索で読み込みが走らないよう、開いた時点で構造を読み込んでおく。
+    """
+    if residency not in INDEX_RESIDENCY_STRUCTURES:
+        raise ValueError(f"Unknown index residency: {residency}")
+    structures = INDEX_RESIDENCY_STRUCTURES[residency]
+    if residency == "memory":
+        index = pt.IndexFactory.of(str(index_dirpath), memory=True)
+    else:
+        index = pt.IndexFactory.of(str(index_dirpath), memory=structures or False)
+    for name in structures:
+        if index.hasIndexStructure(name):
+            index.getIndexStructure(name)
+    return index
+
+
+def materialize_index(index):
+    """
+    検索で使う構造をすべて開いておく。開いたファイルはディレクトリを改名した後も読めるので、
+    一時ディレクトリで開いた索引を差し替え後もそのまま使える（開いたままのディレクトリを改名できない Windows を除く）。
+    """
+    for name in INDEX_RESIDENCY_STRUCTURES["memory"]:
+        if index.hasIndexStructure(name):
+            index.getIndexStructure(name)
+
+
+def is_passage_index(index) -> bool:
+    """パッセージ単位で構築された索引か（メタデータに pstart を持つか）を判定する"""
+    try:
+        return "pstart" in list(index.getMetaIndex().getKeys())
+    except Exception:
+        return False
+
+
+INDEX_STATS_FILENAME = "obret_stats.json"
+
+
+def write_index_stats(index_dirpath: str | Path, note_count: int):
+    """構築時のノート数を索引に添えて保存する（パッセージ索引では文書数とノート数が一致しないため）"""
+    with open(Path(index_dirpath) / INDEX_STATS_FILENAME, "w", encoding="utf-8") as f:
+        json.dump({"note_count": note_count}, f)
+
+
+def read_index_stats(index_dirpath: str | Path) -> dict:
+    try:
+        with open(Path(index_dirpath) / INDEX_STATS_FILENAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 # 日本語の形態素解析器
 def create_japanese_analyzer(stopword_filepath):
     stopword_regex = re.compile(STOP_SYMBOLS)
@@ -48,7 +115,7 @@ def create_japanese_analyzer(stopword_filepath):
     return _japanese_analyzer
 
 
-# そのうちmistuneで実装したい
+# HTML 経由の旧実装（plaintext_benchmark での比較用に残している）
 def replace_wikilink(match):
     link = match.group(1)  # [[東京]] の「東京」、[[東京|Tokyo]] の「東京」
     alias = match.group(2)  # [[東京|Tokyo]] の「Tokyo」、なければ None
@@ -74,9 +141,8 @@ def strip_frontmatter(text: str) -> str:
     return FRONTMATTER_REGEX.sub("", text, count=1)
 
 
-# MarkdownをHTMLに変換するための関数
-def create_md_parser():
-    # Markdownのパーサーを作成
+# MarkdownをHTMLに変換してからプレーンテキストにする旧実装
+def create_html_md_parser():
     markdown = mistune.create_markdown(
         escape=False,
         hard_wrap=True,
@@ -85,6 +151,17 @@ def create_md_parser():
     return lambda text: get_plaintext(markdown(text))
 
 
+# Markdownをプレーンテキストに変換するための関数（mistune の AST から直接生成）
+def create_md_parser():
+    return create_plaintext_parser()
+
+
+@lru_cache(maxsize=1)
+def _shared_md_parser():
+    # 検索のたびにパーサーを作り直さないよう共有する
+    return create_md_parser()
+
+
 # PyTerrierの検索結果をAPIのレスポンス形式に変換
 def df_to_dict_list(
     df,
@@ -93,9 +170,13 @@ def df_to_dict_list(
     query: str | None = None,
 ):
     result = []
+    # パッセージ索引では最良パッセージの本文がそのままスニペットの元になる
+    passage_snippets = "pstart" in df.columns
     for _, row in df.iterrows():
         snippet = None
-        if vault_dirpath and query:
+        if passage_snippets and query:
+            snippet = build_snippet_from_text(row["body_0"], query, context_chars=snippet_maxlen)
+        elif vault_dirpath and query:
             snippet = build_snippet_from_file(
                 row["linkpath"], vault_dirpath, query, context_chars=snippet_maxlen
             )
@@ -115,8 +196,7 @@ def build_snippet_from_file(linkpath: str, vault_dirpath: Path | str, query: str
     ファイル本体を読み取り、クエリにマッチした箇所の前後 context_chars 文字でスニペットを生成する。
     クエリが見つからない場合は先頭から context_chars*2 を返す。
     """
-    terms = [t for t in re.split(r"\s+", query.strip()) if t]
-    if not terms:
+    if not query.strip():
         return None
 
     try:
@@ -126,8 +206,19 @@ def build_snippet_from_file(linkpath: str, vault_dirpath: Path | str, query: str
     except Exception:
         return None
 
-    md_parser = create_md_parser()
-    plain = md_parser(text).strip()
+    return build_snippet_from_text(_shared_md_parser()(text), query, context_chars)
+
+
+def build_snippet_from_text(plain: str, query: str, context_chars: int = 100):
+    """
+    プレーンテキストから、クエリにマッチした箇所の前後 context_chars 文字でスニペットを生成する。
+    クエリが見つからない場合は先頭から context_chars*2 を返す。
+    """
+    terms = [t for t in re.split(r"\s+", query.strip()) if t]
+    if not terms:
+        return None
+
+    plain = plain.strip()
     if not plain:
         return None
 